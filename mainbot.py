@@ -1,104 +1,233 @@
+import hashlib
+import hmac
 import json
+import logging
+import mmap
 import os
 import time
+from collections import defaultdict
 from datetime import datetime
-import git
-import schedule
+import aiohttp
+from aiohttp import web
+from aiolimiter import AsyncLimiter
 import discord
 from discord.ext import tasks, commands
 import asyncio
 
+try:
+    import orjson  # Much faster than the stdlib parser on large listings files
+except ImportError:
+    orjson = None
+
+log = logging.getLogger(__name__)
+
 # Constants
-REPO_URL = 'https://github.com/cvrve/Summer2025-Internships'
-LOCAL_REPO_PATH = 'Summer2025-Internships'
-JSON_FILE_PATH = os.path.join(LOCAL_REPO_PATH, '.github', 'scripts', 'listings.json')
+# Listings file at a branch or commit, fetched with conditional requests so unchanged polls cost a single 304.
+# raw.githubusercontent.com caches branch URLs for a few minutes, so checks started by a push fetch the
+# pushed commit instead
+LISTINGS_URL_TEMPLATE = 'https://raw.githubusercontent.com/cvrve/Summer2025-Internships/{ref}/.github/scripts/listings.json'
+LISTINGS_URL = LISTINGS_URL_TEMPLATE.format(ref='HEAD')
+RAW_CACHE_SECONDS = 300  # How long raw.githubusercontent.com may serve a stale branch URL
+PREVIOUS_DATA_PATH = os.environ.get('PREVIOUS_DATA_PATH', 'previous_data.json')  # Must survive reboots
+CHANNEL_STATE_PATH = os.environ.get('CHANNEL_STATE_PATH', 'channel_state.json')  # Channels that no longer exist
 DISCORD_TOKEN = '' #! Your Discord token
-CHANNEL_IDS = '' #! Your channel IDs
+#! Your channel IDs, comma-separated, e.g. CHANNEL_IDS="123,456". Parsed to ints once here
+CHANNEL_IDS = tuple(int(channel_id) for channel_id in os.environ.get('CHANNEL_IDS', '').split(',') if channel_id)
+# Optional webhook per channel, e.g. WEBHOOK_URLS="123=https://discord.com/api/webhooks/...,456=..."
+WEBHOOK_URLS = {
+    int(channel_id): url
+    for channel_id, url in (entry.split('=', 1) for entry in os.environ.get('WEBHOOK_URLS', '').split(',') if entry)
+}
+# Optional GitHub push webhook: checks run as soon as the listings repository changes
+GITHUB_WEBHOOK_SECRET = os.environ.get('GITHUB_WEBHOOK_SECRET', '')
+GITHUB_WEBHOOK_PORT = int(os.environ.get('GITHUB_WEBHOOK_PORT', '8080'))
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')  # Set to DEBUG to log every role and send
+POLL_INTERVAL_MINUTES = 15 if GITHUB_WEBHOOK_SECRET else 1  # Polling is only a safety net with the webhook
 MAX_RETRIES = 3  # Maximum number of retries for failed channels
+RATE_LIMIT_MESSAGES = 5  # Messages allowed per channel in each rate limit period
+RATE_LIMIT_PERIOD = 5  # Length of the per-channel rate limit period in seconds
+RATE_LIMIT_RETRIES = 3  # Retries after a 429 that got past discord.py's own retries, before counting a failure
+NO_LOCATION = 'Not specified'
+KEY_SEPARATOR = '\x1f'  # ASCII unit separator between title and company name in role keys
+
+# Message templates, filled in with str.format_map. Each fills one block of a quoted Discord message
+QUOTE_PREFIX = '\n>>> '  # Quotes everything after it, up to the end of the message
+DISCORD_MESSAGE_LIMIT = 2000  # Maximum number of characters in a Discord message
+MAX_BLOCK_LENGTH = DISCORD_MESSAGE_LIMIT - len(QUOTE_PREFIX)  # Longest block that fits in a message alone
+NEW_ROLE_TEMPLATE = """# {company_name} just posted a new internship!
+
+### Role:
+[{title}]({url})
+
+### Location:
+{location_str}
+
+### Season:
+{season}
+
+### Sponsorship: `{sponsorship}`
+### Posted on: {today}
+made by the team @ [cvrve](https://www.cvrve.me/)
+"""
+
+DEACTIVATION_TEMPLATE = """# {company_name} internship is no longer active
+
+### Role:
+[{title}]({url})
+
+### Status: `Inactive`
+### Deactivated on: {today}
+made by the team @ [cvrve](https://www.cvrve.me/)
+"""
+
+class InternshipsBot(commands.Bot):
+    """
+    The Discord bot, which also closes the shared HTTP session and the webhook server when it shuts down.
+    """
+    async def close(self):
+        await super().close()
+        await close_http_session()
+        await stop_webhook_server()
 
 # Initialize Discord bot and global variables
 intents = discord.Intents.default()
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = InternshipsBot(command_prefix='!', intents=intents)
 failed_channels = set()  # Keep track of channels that have failed
-channel_failure_counts = {}  # Track failure counts for each channel
+dead_channels = set()  # Failed channels that no longer exist or can't be accessed, saved across restarts
+active_channels = set(CHANNEL_IDS)  # Configured channels that have not failed
+channel_failure_counts = defaultdict(int)  # Track failure counts for each channel
+channel_queues = defaultdict(asyncio.Queue)  # Pending messages for each channel
+workers_task = None  # Task running the channel workers, started once the bot is ready
+http_session = None  # Shared HTTP session for downloads and webhook sends, created on first use and closed with the bot
+webhooks = {}  # Webhook objects for channels configured in WEBHOOK_URLS
+cached_channels = {}  # Channel objects fetched at startup, keyed by channel ID
+check_lock = asyncio.Lock()  # Serializes role checks so overlapping triggers never announce twice
+check_tasks = set()  # Running check tasks, referenced so they aren't garbage collected
+channel_state_lock = asyncio.Lock()  # Keeps channel state writes in the order they were made
+channel_state_tasks = set()  # Pending channel state writes, referenced so they aren't garbage collected
+rate_limiters = defaultdict(lambda: AsyncLimiter(RATE_LIMIT_MESSAGES, RATE_LIMIT_PERIOD))  # Leaky bucket per channel
+previous_keys = None  # Keys of every role seen by the last check, loaded on first check
+previous_active = set()  # Keys of the roles that were active at the last check
+listings_etag = None  # ETag of the last downloaded listings file
+listings_hash = None  # SHA-256 digest of the last parsed listings file
+pushed_checked_at = None  # time.monotonic() of the last check of a pushed commit
+pushed_commit_time = None  # Commit time of the newest pushed commit a check was started for
+webhook_runner = None  # Runner of the GitHub webhook server, cleaned up with the bot
 
-def clone_or_update_repo():
+def loads_json(raw):
     """
-    The function `clone_or_update_repo` clones a repository if it doesn't exist locally or updates it if
-    it already exists.
+    The function `loads_json` parses JSON content, using orjson when it is installed and the standard
+    library otherwise.
+
+    :param raw: The JSON document as bytes, str or a memoryview over bytes
+    :return: The parsed JSON data
     """
-    print("Cloning or updating repository...")
-    if os.path.exists(LOCAL_REPO_PATH):
-        try:
-            repo = git.Repo(LOCAL_REPO_PATH)
-            repo.remotes.origin.pull()
-            print("Repository updated.")
-        except git.exc.InvalidGitRepositoryError:
-            os.rmdir(LOCAL_REPO_PATH)  # Remove invalid directory
-            git.Repo.clone_from(REPO_URL, LOCAL_REPO_PATH)
-            print("Repository cloned fresh.")
-    else:
-        git.Repo.clone_from(REPO_URL, LOCAL_REPO_PATH)
-        print("Repository cloned fresh.")
+    if orjson is not None:
+        return orjson.loads(raw)
+    if isinstance(raw, memoryview):
+        raw = raw.tobytes()  # The stdlib parser does not accept buffers
+    return json.loads(raw)
+
+def dumps_json(data):
+    """
+    The function `dumps_json` serializes data to UTF-8 encoded JSON bytes, using orjson when it is
+    installed and the standard library otherwise.
 
-def read_json():
+    :param data: The data to serialize
+    :return: The serialized JSON as bytes
     """
-    The function `read_json()` reads a JSON file and returns the loaded data.
-    :return: The function `read_json` is returning the data loaded from the JSON file.
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode('utf-8')
+
+async def read_json(ref=None):
+    """
+    The function `read_json()` downloads the listings JSON file and returns the loaded data. The request
+    is conditional on the ETag of the last download, so an unchanged file is never transferred or parsed.
+    A downloaded file whose contents hash the same as the last one parsed is not parsed again either.
+    The ETag and digest of a changed file are returned rather than stored, so the caller can remember them
+    only once the file has been fully handled.
+    :param ref: The commit to download the file at, or None for the default branch
+    :return: The function `read_json` is returning a tuple of the data loaded from the JSON file, its ETag
+    and its SHA-256 digest, or None if the file hasn't changed since the last download.
     """
-    print(f"Reading JSON file from {JSON_FILE_PATH}...")
-    with open(JSON_FILE_PATH, 'r') as file:
-        data = json.load(file)
-    print(f"JSON file read successfully, {len(data)} items loaded.")
-    return data
+    global listings_etag
+    url = LISTINGS_URL if ref is None else LISTINGS_URL_TEMPLATE.format(ref=ref)
+    log.debug("Fetching JSON file from %s...", url)
+    headers = {'If-None-Match': listings_etag} if listings_etag else {}
+    async with get_http_session().get(url, headers=headers) as response:
+        if response.status == 304:
+            log.debug("JSON file unchanged since the last check.")
+            return None
+        response.raise_for_status()
+        raw = await response.read()
+        etag = response.headers.get('ETag')
+    digest = hashlib.sha256(raw).digest()
+    if digest == listings_hash:
+        listings_etag = etag
+        log.debug("JSON file contents unchanged since the last check.")
+        return None
+    data = await asyncio.to_thread(loads_json, raw)
+    log.info("JSON file read successfully, %d items loaded.", len(data))
+    return data, etag, digest
 
 # Function to format the message
-def format_message(role):
+def format_message(role, today):
     """
     The `format_message` function generates a formatted message for a new internship posting, including
     details such as company name, role title, location, season, sponsorship, and posting date.
     
     :param role: The role dictionary containing internship information
-    :return: A formatted message string for Discord
+    :param today: The posting date, preformatted once per check
+    :return: A formatted message block for Discord, to be sent through `batch_messages`
     """
-    cvrve = 'cvrve'
-    location_str = ', '.join(role['locations']) if role['locations'] else 'Not specified'
-    return f"""
->>> # {role['company_name']} just posted a new internship!
-
-### Role:
-[{role['title']}]({role['url']})
-
-### Location:
-{location_str}
-
-### Season:
-{role['season']}
-
-### Sponsorship: `{role['sponsorship']}`
-### Posted on: {datetime.now().strftime('%B, %d')}
-made by the team @ [{cvrve}](https://www.cvrve.me/)
-"""
+    locations = role['locations']
+    fields = role | {'location_str': ', '.join(locations) if locations else NO_LOCATION, 'today': today}
+    message = NEW_ROLE_TEMPLATE.format_map(fields)
+    # Roles open in many places can overflow a message, so list fewer locations until the block fits
+    shown = len(locations)
+    while len(message) > MAX_BLOCK_LENGTH and shown > 0:
+        shown -= 1
+        fields['location_str'] = ', '.join(locations[:shown] + [f'+{len(locations) - shown} more'])
+        message = NEW_ROLE_TEMPLATE.format_map(fields)
+    return message
 
-def format_deactivation_message(role):
+def format_deactivation_message(role, today):
     """
     The function `format_deactivation_message` generates a message indicating that a specific internship
     role is no longer active.
     
     :param role: The role dictionary containing internship information
-    :return: A formatted deactivation message string for Discord
+    :param today: The deactivation date, preformatted once per check
+    :return: A formatted deactivation message block for Discord, to be sent through `batch_messages`
     """
-    cvrve = 'cvrve'
-    return f"""
->>> # {role['company_name']} internship is no longer active
+    return DEACTIVATION_TEMPLATE.format_map(role | {'today': today})
 
-### Role:
-[{role['title']}]({role['url']})
-
-### Status: `Inactive`
-### Deactivated on: {datetime.now().strftime('%B, %d')}
-made by the team @ [{cvrve}](https://www.cvrve.me/)
-"""
+def batch_messages(blocks):
+    """
+    The function `batch_messages` packs formatted role blocks into as few Discord messages as possible,
+    keeping each message within Discord's length limit. A block too long to send even on its own is
+    truncated.
+    
+    :param blocks: The formatted role blocks, in the order they should be posted
+    :return: A list of message strings ready to send
+    """
+    messages = []
+    batch = []
+    length = len(QUOTE_PREFIX)
+    for block in blocks:
+        if len(block) > MAX_BLOCK_LENGTH:
+            # Discord rejects the whole message otherwise, so cut off what can't be sent
+            block = block[:MAX_BLOCK_LENGTH - 1] + '…'
+        if batch and length + 1 + len(block) > DISCORD_MESSAGE_LIMIT:
+            messages.append(QUOTE_PREFIX + '\n'.join(batch))
+            batch = []
+            length = len(QUOTE_PREFIX)
+        length += len(block) + (1 if batch else 0)
+        batch.append(block)
+    if batch:
+        messages.append(QUOTE_PREFIX + '\n'.join(batch))
+    return messages
 
 def compare_roles(old_role, new_role):
     """
@@ -115,6 +244,145 @@ def compare_roles(old_role, new_role):
             changes.append(f"{key} changed from {old_role.get(key)} to {new_role.get(key)}")
     return changes
 
+def blacklist_channel(channel_id, permanent=False):
+    """
+    Stops sending to a channel that keeps failing. Only channels that are gone or inaccessible are
+    remembered across restarts; channels that failed on temporary errors get another chance after one.
+    
+    :param channel_id: The Discord channel ID
+    :param permanent: Whether the channel no longer exists or can't be accessed
+    :return: None
+    """
+    failed_channels.add(channel_id)
+    active_channels.discard(channel_id)
+    if permanent:
+        dead_channels.add(channel_id)
+        save_channel_state()
+
+def record_failure(channel_id):
+    """
+    Counts a failed send to a channel and blacklists the channel once it has failed MAX_RETRIES times.
+    
+    :param channel_id: The Discord channel ID
+    :return: None
+    """
+    channel_failure_counts[channel_id] += 1
+    if channel_failure_counts[channel_id] >= MAX_RETRIES:
+        log.warning("Channel %s has failed %d times, adding to failed channels", channel_id, MAX_RETRIES)
+        blacklist_channel(channel_id)
+
+def load_channel_state():
+    """
+    Restores the dead channels saved before the last restart, so channels that are known to be gone
+    aren't tried again.
+    
+    :return: None
+    """
+    if not os.path.exists(CHANNEL_STATE_PATH):
+        return
+    with open(CHANNEL_STATE_PATH, 'rb') as file:
+        state = loads_json(file.read())
+    dead_channels.update(state.get('dead', []))
+    failed_channels.update(dead_channels)
+    active_channels.difference_update(dead_channels)
+    log.info("Channel state loaded, %d dead channels.", len(dead_channels))
+
+def save_channel_state():
+    """
+    Saves the dead channels in the background. The file is tiny, so it is rewritten whenever a channel
+    dies. The state is captured right away and written off the event loop.
+    
+    :return: None
+    """
+    state = {'dead': sorted(dead_channels)}
+    task = asyncio.create_task(persist_channel_state(dumps_json(state)))
+    channel_state_tasks.add(task)
+    task.add_done_callback(channel_state_tasks.discard)
+
+async def persist_channel_state(data):
+    """
+    Writes serialized channel state to disk in a worker thread. Errors are logged rather than raised, so a
+    full or read-only disk never stops message delivery.
+    
+    :param data: The channel state as JSON bytes
+    :return: None
+    """
+    async with channel_state_lock:
+        try:
+            await asyncio.to_thread(write_atomically, CHANNEL_STATE_PATH, data)
+        except OSError:
+            log.exception("Could not save channel state to %s", CHANNEL_STATE_PATH)
+
+def write_atomically(path, data):
+    """
+    Writes data to a temporary file next to `path` and renames it into place, so a crash mid-write never
+    leaves a truncated file behind.
+    
+    :param path: The path of the file to write
+    :param data: The file contents as bytes
+    :return: None
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+def get_http_session():
+    """
+    Returns the HTTP session shared by the listings download and webhook sends, so connections are kept
+    alive between them.
+    
+    :return: The shared aiohttp.ClientSession
+    """
+    global http_session
+    if http_session is None:
+        http_session = aiohttp.ClientSession()
+    return http_session
+
+async def close_http_session():
+    """
+    Closes the shared HTTP session, if one was created. Called when the bot shuts down.
+    
+    :return: None
+    """
+    global http_session
+    if http_session is not None:
+        await http_session.close()
+        http_session = None
+
+def get_webhook(channel_id):
+    """
+    Returns the webhook configured for a channel in WEBHOOK_URLS, if any.
+    
+    :param channel_id: The Discord channel ID
+    :return: A discord.Webhook, or None when the channel has no webhook
+    """
+    url = WEBHOOK_URLS.get(channel_id)
+    if url is None:
+        return None
+    if channel_id not in webhooks:
+        webhooks[channel_id] = discord.Webhook.from_url(url, session=get_http_session())
+    return webhooks[channel_id]
+
+async def prefetch_channels():
+    """
+    Fetches every configured channel once at startup, so sending never pays for a `fetch_channel`
+    round trip. Channels that no longer exist or can't be accessed are blacklisted straight away; other
+    errors are assumed to be temporary and the channel is fetched again on its first send.
+    
+    :return: None
+    """
+    channel_ids = [channel_id for channel_id in CHANNEL_IDS if channel_id not in WEBHOOK_URLS]
+    results = await asyncio.gather(
+        *(bot.fetch_channel(channel_id) for channel_id in channel_ids), return_exceptions=True
+    )
+    for channel_id, result in zip(channel_ids, results):
+        if isinstance(result, (discord.NotFound, discord.Forbidden)):
+            log.warning("Channel %s is unavailable (%s), adding to failed channels", channel_id, result)
+            blacklist_channel(channel_id, permanent=True)
+        elif not isinstance(result, BaseException):
+            cached_channels[channel_id] = result
+
 async def send_message(message, channel_id):
     """
     The function sends a message to a Discord channel with error handling and retry mechanism.
@@ -124,141 +392,329 @@ async def send_message(message, channel_id):
     :return: None
     """
     if channel_id in failed_channels:
-        print(f"Skipping previously failed channel ID {channel_id}")
+        log.debug("Skipping previously failed channel ID %s", channel_id)
         return
 
     try:
-        print(f"Sending message to channel ID {channel_id}...")
-        channel = bot.get_channel(int(channel_id))
-        
+        log.debug("Sending message to channel ID %s...", channel_id)
+        # Webhooks have their own rate limits and need no channel lookup
+        channel = get_webhook(channel_id) or cached_channels.get(channel_id)
         if channel is None:
-            print(f"Channel {channel_id} not in cache, attempting to fetch...")
+            # Only channels whose prefetch failed with a temporary error get here
+            channel = cached_channels[channel_id] = await bot.fetch_channel(channel_id)
+
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
             try:
-                channel = await bot.fetch_channel(int(channel_id))
-            except discord.NotFound:
-                print(f"Channel {channel_id} not found")
-                channel_failure_counts[channel_id] = channel_failure_counts.get(channel_id, 0) + 1
-                if channel_failure_counts[channel_id] >= MAX_RETRIES:
-                    failed_channels.add(channel_id)
-                return
-            except discord.Forbidden:
-                print(f"No permission for channel {channel_id}")
-                failed_channels.add(channel_id)  # Immediate blacklist on permission issues
-                return
-            except Exception as e:
-                print(f"Error fetching channel {channel_id}: {e}")
-                channel_failure_counts[channel_id] = channel_failure_counts.get(channel_id, 0) + 1
-                if channel_failure_counts[channel_id] >= MAX_RETRIES:
-                    failed_channels.add(channel_id)
-                return
-
-        await channel.send(message)
-        print(f"Successfully sent message to channel {channel_id}")
+                async with rate_limiters[channel_id]:
+                    await channel.send(message)
+                break
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == RATE_LIMIT_RETRIES:
+                    raise
+                # Rate limited anyway, so wait as long as Discord asks and try again
+                retry_after = float(e.response.headers.get('Retry-After', RATE_LIMIT_PERIOD))
+                log.warning("Rate limited on channel %s, retrying in %ss", channel_id, retry_after)
+                await asyncio.sleep(retry_after)
+        log.debug("Successfully sent message to channel %s", channel_id)
         
         # Reset failure count on success
-        if channel_id in channel_failure_counts:
-            del channel_failure_counts[channel_id]
-        
-        await asyncio.sleep(2)  # Rate limiting delay
+        channel_failure_counts.pop(channel_id, None)
         
+    except (discord.NotFound, discord.Forbidden) as e:
+        log.warning("Channel %s is unavailable (%s), adding to failed channels", channel_id, e)
+        blacklist_channel(channel_id, permanent=True)  # Immediate blacklist when the channel is gone
     except Exception as e:
-        print(f"Error sending message to channel {channel_id}: {e}")
-        channel_failure_counts[channel_id] = channel_failure_counts.get(channel_id, 0) + 1
-        if channel_failure_counts[channel_id] >= MAX_RETRIES:
-            print(f"Channel {channel_id} has failed {MAX_RETRIES} times, adding to failed channels")
-            failed_channels.add(channel_id)
+        log.error("Error sending message to channel %s: %s", channel_id, e)
+        record_failure(channel_id)
 
-async def send_messages_to_channels(message):
+async def channel_worker(channel_id, queue):
     """
-    Sends a message to multiple Discord channels concurrently with error handling.
+    Delivers queued messages to a single Discord channel in order, so the rate limiting of one channel
+    never holds up the others.
     
-    :param message: The message content to send
+    :param channel_id: The Discord channel ID
+    :param queue: The asyncio queue holding messages for this channel
     :return: None
     """
-    tasks = []
-    for channel_id in CHANNEL_IDS:
-        if channel_id not in failed_channels:
-            tasks.append(send_message(message, channel_id))
-    
-    # Wait for all messages to be sent
-    await asyncio.gather(*tasks, return_exceptions=True)
+    while True:
+        message = await queue.get()
+        try:
+            await send_message(message, channel_id)
+        finally:
+            queue.task_done()
 
-def check_for_new_roles():
+async def run_channel_workers():
     """
-    The function checks for new roles and deactivated roles, sending appropriate messages to Discord channels.
-    """
-    print("Checking for new roles...")
-    clone_or_update_repo()
+    Runs one worker per configured channel inside a TaskGroup, so cancelling this task on shutdown
+    cancels every worker with it.
     
-    new_data = read_json()
+    :return: None
+    """
+    async with asyncio.TaskGroup() as task_group:
+        for channel_id in CHANNEL_IDS:
+            task_group.create_task(channel_worker(channel_id, channel_queues[channel_id]))
+
+def send_messages_to_channels(message):
+    """
+    Queues a message for every Discord channel that has not failed. Delivery happens in the
+    per-channel workers, so this returns immediately.
     
-    # Compare with previous data if exists
-    if os.path.exists('previous_data.json'):
-        with open('previous_data.json', 'r') as file:
-            old_data = json.load(file)
-        print("Previous data loaded.")
+    :param message: The message content to send
+    :return: None
+    """
+    for channel_id in active_channels:
+        channel_queues[channel_id].put_nowait(message)
+
+def index_roles(roles):
+    """
+    The function `index_roles` collects the keys of all roles and of the active roles in a single pass.
+    A role's key is its title and company name joined by `KEY_SEPARATOR`; a single string caches its
+    hash, unlike a tuple, which rehashes its items on every set lookup.
+
+    :param roles: The list of role dictionaries
+    :return: A tuple of two sets of role keys: all roles and active roles
+    """
+    keys = set()
+    active = set()
+    for role in roles:
+        key = f"{role['title']}{KEY_SEPARATOR}{role['company_name']}"
+        keys.add(key)
+        if role['active']:
+            active.add(key)
+    return keys, active
+
+def load_previous_roles():
+    """
+    The function `load_previous_roles` reads the role keys saved by the last check. Files saved by older
+    versions hold the full list of roles and are indexed on load.
+
+    :return: A tuple of two sets of role keys: all roles and active roles
+    """
+    if os.path.exists(PREVIOUS_DATA_PATH):
+        # Parse straight from the mapped pages instead of copying the whole file into memory first
+        with open(PREVIOUS_DATA_PATH, 'rb') as file, \
+             mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+             memoryview(mapped) as view:
+            old_data = loads_json(view)
+        log.info("Previous data loaded.")
     else:
         old_data = []
-        print("No previous data found.")
+        log.info("No previous data found.")
+    if isinstance(old_data, list):
+        return index_roles(old_data)
+    return set(old_data), {key for key, active in old_data.items() if active}
+
+def save_previous_data(keys, active):
+    """
+    The function `save_previous_data` writes the role keys seen by the current check to disk so they
+    survive a restart. Only each key and whether the role is active are saved, which is all the diff
+    needs. The file is written atomically, so a crash mid-write never leaves a truncated file behind.
+
+    :param keys: The keys of all roles
+    :param active: The keys of the active roles
+    :return: None
+    """
+    write_atomically(PREVIOUS_DATA_PATH, dumps_json({key: key in active for key in keys}))
+
+async def check_for_new_roles(ref=None):
+    """
+    The function checks for new roles and deactivated roles, sending appropriate messages to Discord channels.
+    File I/O and JSON parsing run in worker threads so the event loop keeps servicing Discord meanwhile.
+
+    :param ref: The pushed commit to check, or None to check the default branch
+    """
+    global previous_keys, previous_active, pushed_checked_at, listings_etag, listings_hash
+    if ref is None and pushed_checked_at is not None and time.monotonic() - pushed_checked_at < RAW_CACHE_SECONDS:
+        # The cached branch file may still predate the push, and diffing it would undo the push's changes
+        log.debug("Skipping check, the cached listings may be older than the last push.")
+        return
+    log.debug("Checking for new roles...")
+
+    # Skip parsing and diffing entirely when the listings haven't changed since the last check
+    listings = await read_json(ref)
+    if ref is not None:
+        pushed_checked_at = time.monotonic()
+    if listings is None:
+        log.debug("No updates found.")
+        return
+    new_data, etag, digest = listings
 
+    if previous_keys is None:
+        previous_keys, previous_active = await asyncio.to_thread(load_previous_roles)
+
+    # Index and diff in a single pass, only collecting the roles that need a message
+    new_keys = set()
+    new_active = set()
     new_roles = []
     deactivated_roles = []
 
-    # Create a dictionary for quick lookup of old roles
-    old_roles_dict = {(role['title'], role['company_name']): role for role in old_data}
-
     for new_role in new_data:
-        old_role = old_roles_dict.get((new_role['title'], new_role['company_name']))
-        
-        if old_role:
-            # Check if the role was previously active and is now inactive
-            if old_role['active'] and not new_role['active']:
-                deactivated_roles.append(new_role)
-                print(f"Role {new_role['title']} at {new_role['company_name']} is now inactive.")
-        elif new_role['is_visible'] and new_role['active']:
-            new_roles.append(new_role)
-            print(f"New role found: {new_role['title']} at {new_role['company_name']}")
-
-    # Handle new roles
-    for role in new_roles:
-        message = format_message(role)
-        bot.loop.create_task(send_messages_to_channels(message))
-
-    # Handle deactivated roles
-    for role in deactivated_roles:
-        message = format_deactivation_message(role)
-        bot.loop.create_task(send_messages_to_channels(message))
-
-    # Update previous data
-    with open('previous_data.json', 'w') as file:
-        json.dump(new_data, file)
-    print("Updated previous data with new data.")
+        key = f"{new_role['title']}{KEY_SEPARATOR}{new_role['company_name']}"
+        new_keys.add(key)
+        if new_role['active']:
+            new_active.add(key)
+            if key not in previous_keys and new_role['is_visible']:
+                new_roles.append(new_role)
+                log.debug("New role found: %s at %s", new_role['title'], new_role['company_name'])
+        elif key in previous_active:
+            deactivated_roles.append(new_role)
+            log.debug("Role %s at %s is now inactive.", new_role['title'], new_role['company_name'])
+
+    if new_roles or deactivated_roles:
+        # Format the date once for every message in this check, and only when there is something to send
+        today = datetime.now().strftime('%B, %d')
+
+        # Send every new and deactivated role, several to a message
+        blocks = [format_message(role, today) for role in new_roles]
+        blocks.extend(format_deactivation_message(role, today) for role in deactivated_roles)
+        for message in batch_messages(blocks):
+            send_messages_to_channels(message)
+
+    # Update previous data only when the set of roles actually changed
+    if new_keys != previous_keys or new_active != previous_active:
+        previous_keys, previous_active = new_keys, new_active
+        await asyncio.to_thread(save_previous_data, new_keys, new_active)
+        log.info("Updated previous data with new data.")
+
+    # Only now skip this file on later checks, so a check that failed part way is retried
+    listings_etag, listings_hash = etag, digest
 
     if not new_roles and not deactivated_roles:
-        print("No updates found.")
+        log.debug("No updates found.")
+
+async def run_check(ref=None):
+    """
+    Runs a role check once any check already in progress has finished. Errors are logged rather than
+    raised, so polled and webhook-triggered checks report failures the same way and the polling loop
+    keeps running.
+    
+    :param ref: The pushed commit to check, or None to check the default branch
+    :return: None
+    """
+    async with check_lock:
+        try:
+            await check_for_new_roles(ref)
+        except Exception:
+            log.exception("Error checking for new roles")
+
+def start_check(ref=None):
+    """
+    Starts a role check in the background, for callers that can't await it.
+    
+    :param ref: The pushed commit to check, or None to check the default branch
+    :return: None
+    """
+    task = asyncio.create_task(run_check(ref))
+    check_tasks.add(task)
+    task.add_done_callback(check_tasks.discard)
+
+async def handle_github_webhook(request):
+    """
+    Handles GitHub webhook deliveries, starting a role check of the pushed commit on every push to the
+    default branch of the listings repository. Deliveries of commits older than one already checked
+    (redeliveries or deliveries arriving out of order) are ignored, so an older listings file is never
+    diffed after a newer one.
+    
+    :param request: The aiohttp request for the delivery
+    :return: An empty response: 204 when accepted, 401 when the signature doesn't match
+    """
+    body = await request.read()
+    expected = 'sha256=' + hmac.new(GITHUB_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, request.headers.get('X-Hub-Signature-256', '')):
+        return web.Response(status=401)
+    if request.headers.get('X-GitHub-Event') == 'push':
+        payload = loads_json(body)
+        branch = payload.get('repository', {}).get('default_branch')
+        if payload.get('ref') == f'refs/heads/{branch}' and not payload.get('deleted'):
+            start_pushed_check(payload)
+    return web.Response(status=204)
+
+def start_pushed_check(payload):
+    """
+    Starts a role check of the commit in a push delivery, unless a newer commit was already checked.
+    
+    :param payload: The parsed push delivery
+    :return: None
+    """
+    global pushed_commit_time
+    timestamp = (payload.get('head_commit') or {}).get('timestamp')
+    if timestamp:
+        commit_time = datetime.fromisoformat(timestamp)
+        if pushed_commit_time is not None and commit_time < pushed_commit_time:
+            log.info("Ignoring push of %s, a newer commit was already checked", payload['after'])
+            return
+        pushed_commit_time = commit_time
+    log.info("Push of %s received from GitHub, checking for new roles...", payload['after'])
+    start_check(payload['after'])
+
+async def start_webhook_server():
+    """
+    Starts the HTTP server that receives GitHub webhooks on `/github-webhook`.
+    
+    :return: None
+    """
+    global webhook_runner
+    app = web.Application()
+    app.router.add_post('/github-webhook', handle_github_webhook)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, port=GITHUB_WEBHOOK_PORT).start()
+    except OSError:
+        await runner.cleanup()
+        raise
+    webhook_runner = runner
+    log.info("Listening for GitHub webhooks on port %d", GITHUB_WEBHOOK_PORT)
+
+async def stop_webhook_server():
+    """
+    Stops the GitHub webhook server, if it was started. Called when the bot shuts down.
+    
+    :return: None
+    """
+    global webhook_runner
+    if webhook_runner is not None:
+        await webhook_runner.cleanup()
+        webhook_runner = None
+
+@tasks.loop(minutes=POLL_INTERVAL_MINUTES)
+async def poll_roles():
+    """
+    Checks for new roles once per poll interval. `run_check` logs any errors, since an unhandled
+    exception would stop the loop for good.
+    """
+    await run_check()
 
 @bot.event
 async def on_ready():
     """
     Event handler for when the bot is ready and connected to Discord.
     """
-    print(f'Logged in as {bot.user}')
-    while True:
-        schedule.run_pending()
-        await asyncio.sleep(1)
-
-# Schedule the job
-schedule.every(1).minutes.do(check_for_new_roles)
+    global workers_task
+    log.info('Logged in as %s', bot.user)
+    if not poll_roles.is_running():
+        poll_roles.start()
+    if workers_task is None:
+        await prefetch_channels()
+        workers_task = asyncio.create_task(run_channel_workers())
+        if GITHUB_WEBHOOK_SECRET:
+            try:
+                await start_webhook_server()
+            except OSError:
+                # Polling keeps running, so roles still arrive without the webhook
+                log.exception("Could not start the GitHub webhook server on port %d", GITHUB_WEBHOOK_PORT)
 
 # Run the bot
-print("Starting bot...")
-if DISCORD_TOKEN != '' and CHANNEL_IDS != '':
-    bot.run(DISCORD_TOKEN)
-elif DISCORD_TOKEN == '' and CHANNEL_IDS == '':
-    print("Please provide your Discord token and channel IDs.")
-elif CHANNEL_IDS == '':
-    print("Please provide your channel IDs.")
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+log.info("Starting bot...")
+if DISCORD_TOKEN != '' and CHANNEL_IDS:
+    load_channel_state()
+    bot.run(DISCORD_TOKEN, log_handler=None)  # discord.py logs through the handler configured above
+elif DISCORD_TOKEN == '' and not CHANNEL_IDS:
+    log.error("Please provide your Discord token and channel IDs.")
+elif not CHANNEL_IDS:
+    log.error("Please provide your channel IDs.")
 elif DISCORD_TOKEN == '':
-    print("Please provide your Discord token.")
+    log.error("Please provide your Discord token.")
 else:
-    print("An unknown error occurred.")
\ No newline at end of file
+    log.error("An unknown error occurred.")
\ No newline at end of file
@@ -1,24 +1,45 @@
 import pytest
+import pytest_asyncio
 import asyncio
+import hashlib
+import hmac
 import json
-import os
-from unittest.mock import Mock, patch, AsyncMock, mock_open, MagicMock
+from collections import defaultdict
+from unittest.mock import Mock, patch, AsyncMock, mock_open, MagicMock, call
+import aiohttp
+from aiolimiter import AsyncLimiter
 import discord
 from discord.ext import commands
-import git
 
 # Import the bot code from mainbot.py
 from mainbot import (
-    clone_or_update_repo,
+    loads_json,
+    dumps_json,
     read_json,
     format_message,
     format_deactivation_message,
+    batch_messages,
     compare_roles,
     send_message,
+    handle_github_webhook,
+    poll_roles,
+    on_ready,
+    start_check,
+    prefetch_channels,
     send_messages_to_channels,
+    channel_worker,
+    run_channel_workers,
+    rate_limiters,
     check_for_new_roles,
+    index_roles,
+    load_previous_roles,
+    save_previous_data,
+    load_channel_state,
+    save_channel_state,
     failed_channels,
-    JSON_FILE_PATH,
+    LISTINGS_URL,
+    MAX_RETRIES,
+    RATE_LIMIT_RETRIES,
     bot
 )
 
@@ -34,80 +55,198 @@ SAMPLE_ROLE = {
     'is_visible': True
 }
 
-# Fixture to mock Git repository operations
+# Fixture to mock the shared HTTP session used to download the listings
 @pytest.fixture
-def mock_repo():
-    with patch('git.Repo') as mock:
+def mock_session():
+    with patch('mainbot.get_http_session') as mock:
+        yield mock.return_value
+
+def mock_response(session, status=200, body=b'', etag=None):
+    """Make the mocked session answer the next GET with the given response"""
+    response = MagicMock(status=status, headers={'ETag': etag} if etag else {})
+    response.read = AsyncMock(return_value=body)
+    session.get.return_value.__aenter__.return_value = response
+    return response
+
+# Fixture giving every test fresh rate limiters, since an AsyncLimiter is bound to one event loop
+@pytest.fixture(autouse=True)
+def fresh_rate_limiters():
+    with patch('mainbot.rate_limiters', defaultdict(lambda: AsyncLimiter(5, 5))) as mock:
         yield mock
 
+# Channels fetched by one test must not be reused by the next
+@pytest.fixture(autouse=True)
+def fresh_channel_cache():
+    with patch('mainbot.cached_channels', {}) as mock:
+        yield mock
+
+def downloaded(roles):
+    """Build what read_json returns for a changed listings file"""
+    return roles, '"etag"', b'digest'
+
+# Keep channel state written by failing sends out of the working directory, and writes left pending
+# by one test's event loop out of the next test
+@pytest.fixture(autouse=True)
+def channel_state_path(tmp_path):
+    path = tmp_path / 'channel_state.json'
+    with patch('mainbot.CHANNEL_STATE_PATH', str(path)), \
+         patch('mainbot.dead_channels', set()), \
+         patch('mainbot.channel_state_lock', asyncio.Lock()), \
+         patch('mainbot.channel_state_tasks', set()):
+        yield path
+
 # Fixture to mock Discord bot instance
 @pytest.fixture
 def mock_discord_bot():
     with patch('discord.ext.commands.Bot') as mock:
         yield mock
 
-class TestRepositoryOperations:
-    """Test suite for Git repository operations"""
+@pytest.mark.asyncio
+class TestListingsDownload:
+    """Test suite for downloading the listings file"""
     
-    def test_clone_repo_fresh(self, mock_repo):
-        """Test cloning a new repository when none exists"""
-        with patch('os.path.exists', return_value=False):
-            clone_or_update_repo()
-            mock_repo.clone_from.assert_called_once()
-
-    def test_update_existing_repo(self, mock_repo):
-        """Test updating an existing repository via git pull"""
-        with patch('os.path.exists', return_value=True):
-            repo_instance = Mock()
-            mock_repo.return_value = repo_instance
-            repo_instance.remotes.origin = Mock()
+    async def test_read_json(self, mock_session):
+        """Test downloading and parsing the listings and returning their ETag and digest"""
+        sample_data = [SAMPLE_ROLE]
+        mock_response(mock_session, body=json.dumps(sample_data).encode('utf-8'), etag='"abc"')
+        
+        with patch('mainbot.listings_etag', None), \
+             patch('mainbot.listings_hash', None):
+            data, etag, digest = await read_json()
+            
+            import mainbot
+            assert data == sample_data
+            assert etag == '"abc"'
+            assert digest == hashlib.sha256(json.dumps(sample_data).encode('utf-8')).digest()
+            assert mainbot.listings_etag is None
+            mock_session.get.assert_called_once_with(LISTINGS_URL, headers={})
+
+    async def test_read_json_not_modified(self, mock_session):
+        """Test that an unchanged file is reported as None without parsing"""
+        mock_response(mock_session, status=304)
+        
+        with patch('mainbot.listings_etag', '"abc"'), \
+             patch('mainbot.loads_json') as mock_loads:
+            assert await read_json() is None
             
-            clone_or_update_repo()
+            mock_session.get.assert_called_once_with(LISTINGS_URL, headers={'If-None-Match': '"abc"'})
+            mock_loads.assert_not_called()
+
+    async def test_read_json_at_commit(self, mock_session):
+        """Test that a pushed commit is fetched by its own URL instead of the cached branch URL"""
+        mock_response(mock_session, body=b'[]', etag='"abc"')
+        sha = 'a' * 40
+        
+        with patch('mainbot.listings_etag', None), \
+             patch('mainbot.listings_hash', None):
+            await read_json(sha)
             
-            repo_instance.remotes.origin.pull.assert_called_once()
+            mock_session.get.assert_called_once_with(LISTINGS_URL.replace('/HEAD/', f'/{sha}/'), headers={})
 
-    def test_handle_invalid_repo(self, mock_repo):
-        """Test handling of an invalid Git repository by removing and re-cloning"""
-        with patch('os.path.exists', return_value=True):
-            mock_repo.side_effect = git.exc.InvalidGitRepositoryError
-            with patch('os.rmdir') as mock_rmdir:
-                clone_or_update_repo()
-                mock_rmdir.assert_called_once()
-                mock_repo.clone_from.assert_called_once()
+    async def test_read_json_same_contents(self, mock_session):
+        """Test that a re-downloaded file with unchanged contents is not parsed again"""
+        body = json.dumps([SAMPLE_ROLE]).encode('utf-8')
+        mock_response(mock_session, body=body, etag='"def"')
+        
+        with patch('mainbot.listings_etag', '"abc"'), \
+             patch('mainbot.listings_hash', hashlib.sha256(body).digest()), \
+             patch('mainbot.loads_json') as mock_loads:
+            assert await read_json() is None
+            
+            import mainbot
+            assert mainbot.listings_etag == '"def"'
+            mock_loads.assert_not_called()
+
+    async def test_read_json_error_keeps_etag(self, mock_session):
+        """Test that a failed download raises and keeps the previous ETag"""
+        response = mock_response(mock_session, status=500)
+        response.raise_for_status.side_effect = aiohttp.ClientResponseError(Mock(), (), status=500)
+        
+        with patch('mainbot.listings_etag', '"abc"'):
+            with pytest.raises(aiohttp.ClientResponseError):
+                await read_json()
+            
+            import mainbot
+            assert mainbot.listings_etag == '"abc"'
 
 class TestJsonOperations:
     """Test suite for JSON file operations"""
     
-    def test_read_json(self):
-        """Test reading and parsing JSON data from file"""
-        sample_data = [SAMPLE_ROLE]
-        mock_file = mock_open(read_data=json.dumps(sample_data))
-        
-        with patch('builtins.open', mock_file):
-            data = read_json()
-            assert data == sample_data
-            mock_file.assert_called_once_with(JSON_FILE_PATH, 'r')
+    def test_json_round_trip(self):
+        """Test that serialized data is returned as bytes and parses back unchanged"""
+        raw = dumps_json([SAMPLE_ROLE])
+        assert isinstance(raw, bytes)
+        assert loads_json(raw) == [SAMPLE_ROLE]
+
+    def test_json_stdlib_fallback(self):
+        """Test JSON helpers when orjson is not installed"""
+        with patch('mainbot.orjson', None):
+            raw = dumps_json([SAMPLE_ROLE])
+            assert isinstance(raw, bytes)
+            assert loads_json(raw) == [SAMPLE_ROLE]
+            assert loads_json(memoryview(raw)) == [SAMPLE_ROLE]
 
 class TestMessageFormatting:
     """Test suite for message formatting operations"""
     
     def test_format_message(self):
         """Test formatting a new job posting message with all required fields"""
-        message = format_message(SAMPLE_ROLE)
+        message = format_message(SAMPLE_ROLE, 'June, 01')
         assert SAMPLE_ROLE['company_name'] in message
         assert SAMPLE_ROLE['title'] in message
         assert SAMPLE_ROLE['url'] in message
         assert all(location in message for location in SAMPLE_ROLE['locations'])
         assert SAMPLE_ROLE['season'] in message
         assert SAMPLE_ROLE['sponsorship'] in message
+        assert 'June, 01' in message
+
+    def test_format_message_without_locations(self):
+        """Test formatting a posting with no locations and format characters in its fields"""
+        role = {**SAMPLE_ROLE, 'locations': [], 'title': '100% Remote {Data} Intern'}
+        message = format_message(role, 'June, 01')
+        assert 'Not specified' in message
+        assert '100% Remote {Data} Intern' in message
 
     def test_format_deactivation_message(self):
         """Test formatting a message for a deactivated job posting"""
-        message = format_deactivation_message(SAMPLE_ROLE)
+        message = format_deactivation_message(SAMPLE_ROLE, 'June, 01')
         assert SAMPLE_ROLE['company_name'] in message
         assert SAMPLE_ROLE['title'] in message
         assert SAMPLE_ROLE['url'] in message
         assert 'Inactive' in message
+        assert 'June, 01' in message
+
+    def test_batch_single_message(self):
+        """Test that a single role is sent as one quoted message"""
+        block = format_message(SAMPLE_ROLE, 'June, 01')
+        assert batch_messages([block]) == ['\n>>> ' + block]
+
+    def test_batch_respects_length_limit(self):
+        """Test that many roles are packed into few messages within Discord's limit"""
+        blocks = [format_message({**SAMPLE_ROLE, 'title': f'Role {i}'}, 'June, 01') for i in range(20)]
+        messages = batch_messages(blocks)
+
+        assert 1 < len(messages) < len(blocks)
+        assert all(len(message) <= 2000 for message in messages)
+        assert all(message.startswith('\n>>> ') for message in messages)
+        assert ''.join(messages).count('just posted a new internship!') == len(blocks)
+
+    def test_format_message_many_locations(self):
+        """Test that a role with too many locations to fit lists fewer and counts the rest"""
+        locations = [f'Office {i}, Somewhere' for i in range(200)]
+        message = format_message({**SAMPLE_ROLE, 'locations': locations}, 'June, 01')
+
+        assert len(message) <= 2000 - len('\n>>> ')
+        assert 'Office 0, Somewhere' in message
+        assert 'Office 199, Somewhere' not in message
+        assert 'more' in message
+
+    def test_batch_truncates_oversized_block(self):
+        """Test that a block too long for one message is cut to fit instead of being sent whole"""
+        messages = batch_messages(['x' * 3000, 'short'])
+
+        assert all(len(message) <= 2000 for message in messages)
+        assert messages[-1] == '\n>>> short'
 
     def test_compare_roles(self):
         """Test comparing two versions of a role to detect changes"""
@@ -125,48 +264,213 @@ class TestMessageFormatting:
 class TestDiscordOperations:
     """Test suite for Discord-related operations"""
     
+    @pytest_asyncio.fixture(autouse=True)
+    async def drain_channel_state_writes(self):
+        """Finish the channel state writes started by failing sends before the event loop closes"""
+        yield
+        import mainbot
+        await asyncio.gather(*mainbot.channel_state_tasks)
+
     async def test_send_message_success(self):
         """Test successful message sending to a Discord channel"""
         channel = AsyncMock()
         channel.send = AsyncMock()
         
         with patch('mainbot.bot') as mock_bot:
-            mock_bot.get_channel = Mock(return_value=channel)
             mock_bot.fetch_channel = AsyncMock(return_value=channel)
             
-            await send_message("Test message", "123456789")
+            await send_message("Test message", 123456789)
             channel.send.assert_called_once_with("Test message")
 
-    async def test_send_message_channel_not_found(self):
-        """Test handling of messages when Discord channel is not found"""
+    async def test_prefetch_channels(self):
+        """Test that reachable channels are cached at startup and dead ones are blacklisted"""
+        channel = AsyncMock()
+        
         with patch('mainbot.bot') as mock_bot, \
-             patch('mainbot.channel_failure_counts', {}) as mock_counts:
+             patch('mainbot.CHANNEL_IDS', (123, 456, 789)), \
+             patch('mainbot.cached_channels', {}) as mock_cache, \
+             patch('mainbot.failed_channels', set()) as mock_failed, \
+             patch('mainbot.active_channels', {123, 456, 789}) as mock_active:
+            mock_bot.fetch_channel = AsyncMock(
+                side_effect=[channel, discord.NotFound(Mock(), "Channel not found"), Exception("Timed out")]
+            )
             
-            mock_bot.get_channel.return_value = None
+            await prefetch_channels()
+            assert mock_cache == {123: channel}
+            assert mock_failed == {456}
+            assert mock_active == {123, 789}
+            
+            await send_message("Test message", 123)
+            channel.send.assert_called_once_with("Test message")
+            assert mock_bot.fetch_channel.call_count == 3
+
+    async def test_http_session_closed_with_bot(self):
+        """Test that shutting the bot down closes the shared HTTP session"""
+        session = AsyncMock()
+        
+        with patch('mainbot.http_session', session), \
+             patch('discord.ext.commands.Bot.close', AsyncMock()):
+            await bot.close()
+            
+            import mainbot
+            session.close.assert_called_once()
+            assert mainbot.http_session is None
+
+    async def test_webhook_server_stopped_with_bot(self):
+        """Test that shutting the bot down cleans up the webhook server"""
+        runner = AsyncMock()
+        
+        with patch('mainbot.webhook_runner', runner), \
+             patch('mainbot.http_session', None), \
+             patch('discord.ext.commands.Bot.close', AsyncMock()):
+            await bot.close()
+            
+            import mainbot
+            runner.cleanup.assert_called_once()
+            assert mainbot.webhook_runner is None
+
+    async def test_send_message_via_webhook(self):
+        """Test that channels with a configured webhook are sent to through it"""
+        webhook = AsyncMock()
+        
+        with patch('mainbot.bot') as mock_bot, \
+             patch('mainbot.WEBHOOK_URLS', {123456789: "https://discord.com/api/webhooks/1/token"}), \
+             patch('mainbot.webhooks', {}), \
+             patch('mainbot.get_http_session') as mock_session, \
+             patch('discord.Webhook.from_url', return_value=webhook) as mock_from_url:
+            await send_message("Test message", 123456789)
+            
+            mock_from_url.assert_called_once_with(
+                "https://discord.com/api/webhooks/1/token", session=mock_session.return_value
+            )
+            webhook.send.assert_called_once_with("Test message")
+            mock_bot.fetch_channel.assert_not_called()
+
+    async def test_send_message_retries_after_rate_limit(self, fresh_channel_cache):
+        """Test that a 429 response is retried after the Retry-After delay"""
+        response = Mock(status=429, reason='Too Many Requests', headers={'Retry-After': '1.5'})
+        channel = AsyncMock()
+        channel.send = AsyncMock(side_effect=[discord.HTTPException(response, 'rate limited'), None])
+        
+        fresh_channel_cache[123456789] = channel
+        
+        with patch('mainbot.asyncio.sleep', AsyncMock()) as mock_sleep:
+            await send_message("Test message", 123456789)
+            assert channel.send.call_count == 2
+            mock_sleep.assert_called_once_with(1.5)
+
+    async def test_send_message_gives_up_after_rate_limit_retries(self, fresh_channel_cache):
+        """Test that a channel that stays rate limited counts a failure instead of retrying forever"""
+        response = Mock(status=429, reason='Too Many Requests', headers={'Retry-After': '1.5'})
+        channel = AsyncMock()
+        channel.send = AsyncMock(side_effect=discord.HTTPException(response, 'rate limited'))
+        fresh_channel_cache[123456789] = channel
+        
+        with patch('mainbot.asyncio.sleep', AsyncMock()) as mock_sleep, \
+             patch('mainbot.channel_failure_counts', defaultdict(int)) as mock_counts:
+            await send_message("Test message", 123456789)
+            assert channel.send.call_count == RATE_LIMIT_RETRIES + 1
+            assert mock_sleep.call_count == RATE_LIMIT_RETRIES
+            assert mock_counts[123456789] == 1
+
+    async def test_rate_limiters_per_channel(self):
+        """Test that every channel gets its own 5 messages per 5 seconds limiter"""
+        limiter = rate_limiters[123]
+        assert isinstance(limiter, AsyncLimiter)
+        assert (limiter.max_rate, limiter.time_period) == (5, 5)
+        assert rate_limiters[456] is not limiter
+        assert rate_limiters[123] is limiter
+
+    async def test_send_message_channel_not_found(self):
+        """Test that a channel that no longer exists is blacklisted and remembered at once"""
+        with patch('mainbot.bot') as mock_bot, \
+             patch('mainbot.failed_channels', set()) as mock_failed, \
+             patch('mainbot.active_channels', {123456789}) as mock_active:
             mock_bot.fetch_channel = AsyncMock(side_effect=discord.NotFound(Mock(), "Channel not found"))
             
-            await send_message("Test message", "123456789")
-            assert mock_counts.get("123456789", 0) > 0
+            await send_message("Test message", 123456789)
+            
+            import mainbot
+            assert mock_failed == {123456789}
+            assert mock_active == set()
+            assert mainbot.dead_channels == {123456789}
+
+    async def test_channel_blacklisted_after_max_retries(self):
+        """Test that a channel stops receiving messages after failing MAX_RETRIES times"""
+        with patch('mainbot.bot') as mock_bot, \
+             patch('mainbot.channel_failure_counts', defaultdict(int)) as mock_counts, \
+             patch('mainbot.failed_channels', set()) as mock_failed, \
+             patch('mainbot.active_channels', {123456789}) as mock_active:
+            mock_bot.fetch_channel = AsyncMock(side_effect=Exception("Timed out"))
+            
+            for attempt in range(MAX_RETRIES):
+                assert mock_failed == set()
+                await send_message("Test message", 123456789)
+                assert mock_counts[123456789] == attempt + 1
+            
+            import mainbot
+            assert mock_failed == {123456789}
+            assert mock_active == set()
+            assert mainbot.dead_channels == set()
+
+    async def test_forbidden_channel_is_deactivated(self):
+        """Test that a channel without permissions stops receiving messages"""
+        with patch('mainbot.bot') as mock_bot, \
+             patch('mainbot.failed_channels', set()) as mock_failed, \
+             patch('mainbot.active_channels', {123456789}) as mock_active:
+            mock_bot.fetch_channel = AsyncMock(side_effect=discord.Forbidden(Mock(), "Missing access"))
+            
+            await send_message("Test message", 123456789)
+            assert mock_failed == {123456789}
+            assert mock_active == set()
 
     async def test_send_messages_to_channels(self):
-        """Test sending messages to multiple Discord channels"""
+        """Test queueing a message for multiple Discord channels"""
         test_message = "Test message"
-        channel_ids = ["123", "456"]
+        channel_ids = (123, 456)
+        
+        with patch('mainbot.active_channels', set(channel_ids)), \
+             patch('mainbot.channel_queues', defaultdict(asyncio.Queue)) as mock_queues:
+            send_messages_to_channels(test_message)
+            assert set(mock_queues) == set(channel_ids)
+            assert all(queue.get_nowait() == test_message for queue in mock_queues.values())
+
+    async def test_run_channel_workers(self):
+        """Test that channel workers drain every queue and stop together when cancelled"""
+        channel_ids = (123, 456)
         
         with patch('mainbot.CHANNEL_IDS', channel_ids), \
-             patch('mainbot.send_message') as mock_send:
-            mock_send.return_value = asyncio.Future()
-            mock_send.return_value.set_result(None)
-            
-            await send_messages_to_channels(test_message)
+             patch('mainbot.active_channels', set(channel_ids)), \
+             patch('mainbot.channel_queues', defaultdict(asyncio.Queue)) as mock_queues, \
+             patch('mainbot.send_message', AsyncMock()) as mock_send:
+            send_messages_to_channels("Test message")
+            workers = asyncio.create_task(run_channel_workers())
+            await asyncio.gather(*(queue.join() for queue in mock_queues.values()))
             assert mock_send.call_count == len(channel_ids)
+            
+            workers.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await workers
+
+    async def test_channel_worker_preserves_order(self):
+        """Test that a channel worker delivers queued messages in order"""
+        queue = asyncio.Queue()
+        for message in ("first", "second"):
+            queue.put_nowait(message)
+        
+        with patch('mainbot.send_message', AsyncMock()) as mock_send:
+            worker = asyncio.create_task(channel_worker(123, queue))
+            await queue.join()
+            worker.cancel()
+        
+        assert [c.args[0] for c in mock_send.call_args_list] == ["first", "second"]
 
 @pytest.mark.asyncio
 class TestRoleChecking:
     """Test suite for role checking and update detection"""
     
     @pytest.fixture(autouse=True)
-    async def setup(self):
+    def setup(self):
         """Setup fixture for role checking tests with mocked bot and event loop"""
         mock_bot = AsyncMock()
         mock_loop = AsyncMock()
@@ -174,6 +478,8 @@ class TestRoleChecking:
         mock_bot.loop = mock_loop
         
         with patch('mainbot.bot', mock_bot), \
+             patch('mainbot.listings_etag', None), \
+             patch('mainbot.listings_hash', None), \
              patch('asyncio.get_event_loop', return_value=mock_loop):
             yield mock_bot
 
@@ -202,18 +508,17 @@ class TestRoleChecking:
         async def async_check_for_new_roles():
             """Helper function to simulate role checking process"""
             import mainbot
-            new_data = mainbot.read_json()
+            new_data, _, _ = await mainbot.read_json()
             old_data = []
             
             for new_role in new_data:
                 if new_role['is_visible'] and new_role['active']:
-                    message = mainbot.format_message(new_role)
+                    message = mainbot.format_message(new_role, 'June, 01')
                     await mock_send_messages_to_channels(message)
             
             return new_data, []
 
-        with patch('mainbot.clone_or_update_repo') as mock_clone, \
-             patch('mainbot.read_json', return_value=new_data) as mock_read, \
+        with patch('mainbot.read_json', return_value=(new_data, None, None)) as mock_read, \
              patch('mainbot.send_messages_to_channels', mock_send_messages_to_channels), \
              patch('mainbot.check_for_new_roles', side_effect=async_check_for_new_roles):
 
@@ -224,33 +529,335 @@ class TestRoleChecking:
             assert any('New Company' in msg for msg in mock_messages)
             assert len(result_data) == 2
             
-            mock_clone.assert_not_called()
             mock_read.assert_called_once()
 
-    async def test_check_for_deactivated_roles(self):
-        """Test detection and handling of deactivated job roles"""
+    async def test_check_for_deactivated_roles(self, tmp_path):
+        """Test that a role saved as active and now inactive is announced as inactive"""
         old_role = {**SAMPLE_ROLE, 'active': True}
         new_role = {**SAMPLE_ROLE, 'active': False}
+        path = tmp_path / 'previous_data.json'
+        path.write_bytes(json.dumps([old_role]).encode('utf-8'))
         
-        with patch('mainbot.clone_or_update_repo') as mock_clone, \
-             patch('mainbot.read_json', return_value=[new_role]) as mock_read, \
-             patch('builtins.open', mock_open(read_data=json.dumps([old_role]))), \
+        with patch('mainbot.previous_keys', None), \
+             patch('mainbot.previous_active', set()), \
+             patch('mainbot.PREVIOUS_DATA_PATH', str(path)), \
+             patch('mainbot.read_json', AsyncMock(return_value=downloaded([new_role]))) as mock_read, \
              patch('mainbot.send_messages_to_channels') as mock_send:
+            await check_for_new_roles()
+            
+            mock_read.assert_called_once()
+            mock_send.assert_called_once()
+            assert 'Inactive' in mock_send.call_args.args[0]
+            assert 'just posted a new internship' not in mock_send.call_args.args[0]
+
+    async def test_unchanged_roles_skip_write(self):
+        """Test that previous data is not rewritten when nothing changed"""
+        key = 'Software Engineer Intern\x1fTest Company'
+
+        with patch('mainbot.previous_keys', {key}), \
+             patch('mainbot.previous_active', {key}), \
+             patch('mainbot.read_json', AsyncMock(return_value=downloaded([SAMPLE_ROLE]))), \
+             patch('mainbot.send_messages_to_channels') as mock_send, \
+             patch('builtins.open', mock_open()) as mock_file:
+            await check_for_new_roles()
+
+            mock_file.assert_not_called()
+            mock_send.assert_not_called()
+
+    async def test_deactivated_role_updates_cache(self):
+        """Test that a deactivation is announced, cached and written to disk"""
+        key = 'Software Engineer Intern\x1fTest Company'
+        new_role = {**SAMPLE_ROLE, 'active': False}
+
+        with patch('mainbot.previous_keys', {key}), \
+             patch('mainbot.previous_active', {key}), \
+             patch('mainbot.read_json', AsyncMock(return_value=downloaded([new_role]))), \
+             patch('mainbot.send_messages_to_channels') as mock_send, \
+             patch('mainbot.save_previous_data') as mock_save:
+            await check_for_new_roles()
+
+            import mainbot
+            assert mainbot.previous_active == set()
+            mock_send.assert_called_once()
+            mock_save.assert_called_once_with({key}, set())
+
+    async def test_new_role_announced_once(self):
+        """Test that only roles missing from the previous check are announced"""
+        key = 'Software Engineer Intern\x1fTest Company'
+        new_role = {**SAMPLE_ROLE, 'title': 'New Role'}
+        hidden_role = {**SAMPLE_ROLE, 'title': 'Hidden Role', 'is_visible': False}
+
+        with patch('mainbot.previous_keys', {key}), \
+             patch('mainbot.previous_active', {key}), \
+             patch('mainbot.read_json', AsyncMock(return_value=downloaded([SAMPLE_ROLE, new_role, hidden_role]))), \
+             patch('mainbot.save_previous_data'), \
+             patch('mainbot.send_messages_to_channels') as mock_send:
+            await check_for_new_roles()
+
+            mock_send.assert_called_once()
+            assert 'New Role' in mock_send.call_args.args[0]
+
+    async def test_listings_remembered_after_check(self):
+        """Test that the ETag and digest are stored once the new listings have been handled"""
+        with patch('mainbot.previous_keys', set()), \
+             patch('mainbot.read_json', AsyncMock(return_value=downloaded([SAMPLE_ROLE]))), \
+             patch('mainbot.save_previous_data'), \
+             patch('mainbot.send_messages_to_channels'):
+            await check_for_new_roles()
+
+            import mainbot
+            assert (mainbot.listings_etag, mainbot.listings_hash) == ('"etag"', b'digest')
+
+    async def test_failed_check_is_retried(self):
+        """Test that listings whose check failed part way are not skipped by the next check"""
+        broken_role = {key: value for key, value in SAMPLE_ROLE.items() if key != 'url'}
+
+        with patch('mainbot.previous_keys', set()), \
+             patch('mainbot.read_json', AsyncMock(return_value=downloaded([broken_role]))), \
+             patch('mainbot.save_previous_data') as mock_save, \
+             patch('mainbot.send_messages_to_channels'):
+            with pytest.raises(KeyError):
+                await check_for_new_roles()
+
+            import mainbot
+            assert (mainbot.listings_etag, mainbot.listings_hash) == (None, None)
+            mock_save.assert_not_called()
+
+    async def test_poll_survives_errors(self):
+        """Test that a failing check doesn't propagate out of the polling loop"""
+        with patch('mainbot.check_for_new_roles', AsyncMock(side_effect=aiohttp.ClientError("offline"))) as mock_check:
+            await poll_roles.coro()
+
+            mock_check.assert_called_once()
+
+    async def test_webhook_check_errors_are_logged(self):
+        """Test that a failing background check is logged instead of left unretrieved on its task"""
+        with patch('mainbot.check_for_new_roles', AsyncMock(side_effect=aiohttp.ClientError("offline"))), \
+             patch('mainbot.check_tasks', set()) as mock_tasks, \
+             patch('mainbot.log') as mock_log:
+            start_check()
+            task = next(iter(mock_tasks))
+            await task
+
+            assert task.exception() is None
+            mock_log.exception.assert_called_once()
+
+    async def test_poll_skipped_after_push(self):
+        """Test that polls right after a pushed commit was checked don't diff the stale cached branch file"""
+        with patch('mainbot.pushed_checked_at', None), \
+             patch('mainbot.read_json', AsyncMock(return_value=None)) as mock_read:
+            await check_for_new_roles('a' * 40)
+            await check_for_new_roles()
+
+            mock_read.assert_called_once_with('a' * 40)
+
+    async def test_unchanged_listings_skip_check(self):
+        """Test that nothing is loaded, sent or written when the listings are unchanged"""
+        with patch('mainbot.previous_keys', None), \
+             patch('mainbot.read_json', AsyncMock(return_value=None)), \
+             patch('mainbot.load_previous_roles') as mock_load, \
+             patch('mainbot.send_messages_to_channels') as mock_send, \
+             patch('mainbot.save_previous_data') as mock_save:
+            await check_for_new_roles()
+
+            mock_load.assert_not_called()
+            mock_send.assert_not_called()
+            mock_save.assert_not_called()
+
+@pytest.mark.asyncio
+class TestGithubWebhook:
+    """Test suite for the GitHub push webhook"""
+
+    @staticmethod
+    def make_request(body, signature, event='push'):
+        """Build a mock aiohttp request for a webhook delivery"""
+        request = Mock()
+        request.read = AsyncMock(return_value=body)
+        request.headers = {'X-Hub-Signature-256': signature, 'X-GitHub-Event': event}
+        return request
+
+    # Commit times of pushes seen by one test must not make the next one's pushes look out of date
+    @pytest.fixture(autouse=True)
+    def fresh_pushed_commit_time(self):
+        with patch('mainbot.pushed_commit_time', None):
+            yield
+
+    @staticmethod
+    def make_push(ref='refs/heads/main', sha='a' * 40, timestamp='2025-01-01T12:00:00-05:00'):
+        """Build a signed push delivery body and its signature"""
+        body = json.dumps({
+            'ref': ref,
+            'after': sha,
+            'head_commit': {'id': sha, 'timestamp': timestamp},
+            'repository': {'default_branch': 'main'}
+        }).encode()
+        return body, 'sha256=' + hmac.new(b'secret', body, hashlib.sha256).hexdigest()
+
+    async def test_signed_push_starts_check(self):
+        """Test that a correctly signed push delivery starts a check of the pushed commit"""
+        body, signature = self.make_push()
+
+        with patch('mainbot.GITHUB_WEBHOOK_SECRET', 'secret'), \
+             patch('mainbot.start_check') as mock_start:
+            response = await handle_github_webhook(self.make_request(body, signature))
+
+        assert response.status == 204
+        mock_start.assert_called_once_with('a' * 40)
+
+    async def test_out_of_order_push_ignored(self):
+        """Test that a push of an older commit arriving after a newer one doesn't start a check"""
+        newer = self.make_push(sha='b' * 40, timestamp='2025-01-01T12:05:00-05:00')
+        older = self.make_push(sha='a' * 40, timestamp='2025-01-01T12:00:00-05:00')
+
+        with patch('mainbot.GITHUB_WEBHOOK_SECRET', 'secret'), \
+             patch('mainbot.start_check') as mock_start:
+            await handle_github_webhook(self.make_request(*newer))
+            response = await handle_github_webhook(self.make_request(*older))
+            await handle_github_webhook(self.make_request(*newer))
+
+        assert response.status == 204
+        assert mock_start.call_args_list == [call('b' * 40), call('b' * 40)]
+
+    async def test_push_to_other_branch_ignored(self):
+        """Test that pushes to branches other than the default one don't start a check"""
+        body, signature = self.make_push('refs/heads/feature')
+
+        with patch('mainbot.GITHUB_WEBHOOK_SECRET', 'secret'), \
+             patch('mainbot.start_check') as mock_start:
+            response = await handle_github_webhook(self.make_request(body, signature))
+
+        assert response.status == 204
+        mock_start.assert_not_called()
+
+    async def test_bad_signature_rejected(self):
+        """Test that a delivery with a wrong signature is rejected without checking"""
+        with patch('mainbot.GITHUB_WEBHOOK_SECRET', 'secret'), \
+             patch('mainbot.start_check') as mock_start:
+            response = await handle_github_webhook(self.make_request(b'{}', 'sha256=bad'))
+
+        assert response.status == 401
+        mock_start.assert_not_called()
+
+    async def test_webhook_server_failure_keeps_polling(self):
+        """Test that polling still starts when the webhook server can't listen on its port"""
+        with patch('mainbot.GITHUB_WEBHOOK_SECRET', 'secret'), \
+             patch('mainbot.workers_task', None), \
+             patch('mainbot.prefetch_channels', AsyncMock()), \
+             patch('mainbot.run_channel_workers', AsyncMock()), \
+             patch('mainbot.start_webhook_server', AsyncMock(side_effect=OSError("Address already in use"))), \
+             patch('mainbot.poll_roles') as mock_poll:
+            mock_poll.is_running.return_value = False
+            await on_ready()
             
-            mock_send.return_value = asyncio.Future()
-            mock_send.return_value.set_result(None)
+            mock_poll.start.assert_called_once()
+
+class TestPreviousRoles:
+    """Test suite for the in-memory cache of previously seen roles"""
+
+    def test_load_previous_roles(self, tmp_path):
+        """Test indexing a full list of roles saved by older versions"""
+        path = tmp_path / 'previous_data.json'
+        path.write_bytes(json.dumps([SAMPLE_ROLE]).encode('utf-8'))
+
+        with patch('mainbot.PREVIOUS_DATA_PATH', str(path)):
+            keys, active = load_previous_roles()
+
+        key = 'Software Engineer Intern\x1fTest Company'
+        assert keys == {key}
+        assert active == {key}
+
+    def test_save_previous_data_is_atomic(self, tmp_path):
+        """Test that role keys are written to a temporary file and renamed into place"""
+        path = tmp_path / 'previous_data.json'
+        path.write_bytes(b'[]')
+
+        with patch('mainbot.PREVIOUS_DATA_PATH', str(path)):
+            save_previous_data({'A\x1fB', 'C\x1fD'}, {'A\x1fB'})
+
+        assert json.loads(path.read_bytes()) == {'A\x1fB': True, 'C\x1fD': False}
+        assert not (tmp_path / 'previous_data.json.tmp').exists()
+
+    def test_saved_keys_round_trip(self, tmp_path):
+        """Test that saved role keys load back unchanged"""
+        keys, active = {'A\x1fB', 'C\x1fD'}, {'A\x1fB'}
+
+        with patch('mainbot.PREVIOUS_DATA_PATH', str(tmp_path / 'previous_data.json')):
+            save_previous_data(keys, active)
+            assert load_previous_roles() == (keys, active)
+
+    def test_index_roles(self):
+        """Test splitting roles into all keys and active keys"""
+        inactive_role = {**SAMPLE_ROLE, 'title': 'Old Role', 'active': False}
+
+        keys, active = index_roles([SAMPLE_ROLE, inactive_role])
+
+        assert keys == {'Software Engineer Intern\x1fTest Company', 'Old Role\x1fTest Company'}
+        assert active == {'Software Engineer Intern\x1fTest Company'}
+
+class TestChannelState:
+    """Test suite for persisting failed channels across restarts"""
+
+    @pytest.mark.asyncio
+    async def test_channel_state_round_trip(self, channel_state_path):
+        """Test that dead channels are restored after a restart"""
+        with patch('mainbot.dead_channels', {123}):
+            save_channel_state()
             
-            async def async_check_for_new_roles():
-                check_for_new_roles()
-                future = asyncio.Future()
-                future.set_result(None)
-                return future
+            import mainbot
+            await asyncio.gather(*mainbot.channel_state_tasks)
+
+        with patch('mainbot.failed_channels', set()) as mock_failed, \
+             patch('mainbot.active_channels', {123, 456}) as mock_active:
+            load_channel_state()
+            assert mock_failed == {123}
+            assert mock_active == {456}
+
+    @pytest.mark.asyncio
+    async def test_timed_out_channel_active_after_restart(self, channel_state_path):
+        """Test that a channel blacklisted for temporary errors is tried again after a restart"""
+        with patch('mainbot.bot') as mock_bot, \
+             patch('mainbot.channel_failure_counts', defaultdict(int)), \
+             patch('mainbot.failed_channels', set()) as mock_failed, \
+             patch('mainbot.active_channels', {123, 456}):
+            mock_bot.fetch_channel = AsyncMock(side_effect=[
+                *[Exception("Timed out")] * MAX_RETRIES, discord.NotFound(Mock(), "Channel not found")
+            ])
+            for _ in range(MAX_RETRIES):
+                await send_message("Test message", 123)
+            await send_message("Test message", 456)
+            assert mock_failed == {123, 456}
             
-            with patch('mainbot.check_for_new_roles', async_check_for_new_roles):
-                await async_check_for_new_roles()
+            import mainbot
+            await asyncio.gather(*mainbot.channel_state_tasks)
+
+        with patch('mainbot.dead_channels', set()), \
+             patch('mainbot.failed_channels', set()) as mock_failed, \
+             patch('mainbot.channel_failure_counts', defaultdict(int)) as mock_counts, \
+             patch('mainbot.active_channels', {123, 456}) as mock_active:
+            load_channel_state()
+            assert mock_failed == {456}
+            assert mock_active == {123}
+            assert mock_counts == {}
+
+    def test_load_channel_state_without_file(self, channel_state_path):
+        """Test that a missing state file leaves every channel active"""
+        with patch('mainbot.failed_channels', set()) as mock_failed, \
+             patch('mainbot.active_channels', {123}) as mock_active:
+            load_channel_state()
+            assert mock_failed == set()
+            assert mock_active == {123}
+
+    @pytest.mark.asyncio
+    async def test_save_errors_are_logged(self, tmp_path):
+        """Test that a failed write is logged instead of raised into the channel workers"""
+        with patch('mainbot.CHANNEL_STATE_PATH', str(tmp_path / 'missing' / 'channel_state.json')), \
+             patch('mainbot.log') as mock_log:
+            save_channel_state()
             
-            mock_clone.assert_called_once()
-            mock_read.assert_called_once()
+            import mainbot
+            await asyncio.gather(*mainbot.channel_state_tasks)
+
+            mock_log.exception.assert_called_once()
 
 if __name__ == '__main__':
-    pytest.main(['-v', '--cov=.', '--cov-report=xml'])
\ No newline at end of file
+    pytest.main(['-v', '--cov=.', '--cov-report=xml'])